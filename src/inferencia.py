@@ -1,15 +1,48 @@
 import sys
 import os
 import argparse
-from .ocr_pipeline import OCRPipeline
+import collections
+import concurrent.futures
+import contextlib
+import functools
+import multiprocessing
+import queue
+import re
+import threading
+import time
 
-def process_single_image(pipeline, image_path, output_path=None, verbose=False):
-    if not os.path.exists(image_path):
-        print(f"Error: La imagen {image_path} no existe.")
-        return
+# Extensiones sin el punto, tal como las devuelve name.rpartition('.'). Los JPEG
+# ('jpg', 'jpeg') son los que utils._JPEG_EXTS decodifica con libjpeg-turbo.
+IMAGE_EXTS = frozenset({'png', 'jpg', 'jpeg', 'bmp', 'tiff', 'tif'})
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "proyecto_ocr")
+
+def _get_pipeline(**options):
+    # La importación se difiere hasta aquí para que --help y los errores de
+    # argumentos no paguen la carga de PaddlePaddle.
+    from .ocr_pipeline import get_pipeline
+    return get_pipeline(**options)
+
+def _pipeline_options(args):
+    return {"lang": args.lang, "device": args.dispositivo, "precision": args.precision, "rec_batch_size": args.lote_rec,
+            "doc_preprocessing": not args.documento_limpio, "cache_dir": args.cache}
+
+def _recognize(pipeline, image_path, verbose=False, max_side=None):
+    # Como el pipeline, utils (OpenCV, libjpeg-turbo) se importa solo cuando
+    # hay imágenes que leer.
+    from .utils import load_image
 
     print(f"Procesando: {image_path}")
-    text = pipeline.process_image(image_path, verbose=verbose)
+    image = load_image(image_path, max_side)
+    if image is None:
+        print(f"Error: La imagen {image_path} no existe o no se pudo leer.")
+        return None
+    return pipeline.process_array(image, verbose=verbose, name=image_path)
+
+def process_single_image(pipeline, image_path, output_path=None, verbose=False, max_side=None):
+    text = _recognize(pipeline, image_path, verbose, max_side)
+    if text is None:
+        return
     
     if output_path:
         with open(output_path, 'w', encoding='utf-8') as f:
@@ -20,6 +53,204 @@ def process_single_image(pipeline, image_path, output_path=None, verbose=False):
         print(text)
         print("\n" + "="*30 + "\n")
 
+def _natural_key(name):
+    # Orden de lectura de un libro escaneado: p2 antes que p10 y sin distinguir
+    # mayúsculas. Tras el split, las posiciones impares son los números.
+    parts = re.split(r'([0-9]+)', name.casefold())
+    return [int(part) if i % 2 else part for i, part in enumerate(parts)], name
+
+def _list_tasks(dir_path, output_dir, exts=IMAGE_EXTS):
+    # Un único recorrido del directorio produce ya los pares
+    # (imagen, archivo de salida). Un solo rpartition por nombre sirve para
+    # filtrar por extensión y para obtener el nombre del .txt.
+    output_dir = os.fspath(output_dir)
+    tasks = []
+    with os.scandir(os.fspath(dir_path)) as it:
+        for e in it:
+            stem, _, ext = e.name.rpartition('.')
+            if stem and ext.lower() in exts and e.is_file():
+                tasks.append((e.path, os.path.join(output_dir, stem + '.txt')))
+    tasks.sort(key=lambda task: _natural_key(os.path.basename(task[0])))
+    return tasks
+
+def _read_images(tasks, read_queue, workers=None, max_side=None):
+    from .utils import load_image
+
+    # OpenCV y libjpeg-turbo liberan el GIL al decodificar, así que varias
+    # páginas se decodifican a la vez en hilos. Como mucho hay `workers`
+    # decodificaciones en curso, para no cargar toda la carpeta en memoria.
+    workers = workers or min(8, os.cpu_count() or 1)
+    pending = collections.deque()
+
+    def emit_oldest():
+        image_path, output_file, future = pending.popleft()
+        try:
+            image = future.result()
+        except Exception as exc:
+            # Una imagen corrupta se trata como ilegible en lugar de cortar
+            # la lectura del resto de la carpeta; el motivo viaja en la cola
+            # y se informa, junto con su "Procesando", desde el hilo de OCR.
+            image = exc
+        read_queue.put((image_path, output_file, image))
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            for image_path, output_file in tasks:
+                pending.append((image_path, output_file, executor.submit(load_image, image_path, max_side)))
+                if len(pending) >= workers:
+                    emit_oldest()
+            while pending:
+                emit_oldest()
+    finally:
+        # Aunque falle una lectura, el hilo de OCR no debe quedarse esperando.
+        read_queue.put(None)
+
+def _write_results(write_queue, saved, errors, full_text_path=None):
+    finished = False
+    try:
+        # El texto completo se vuelca página a página sobre un único archivo
+        # abierto durante toda la ejecución, sin acumularlo en memoria.
+        full_text_file = open(full_text_path, 'w', encoding='utf-8') if full_text_path else contextlib.nullcontext()
+        with full_text_file as full_text:
+            while True:
+                item = write_queue.get()
+                if item is None:
+                    finished = True
+                    break
+                output_file, text = item
+                with open(output_file, 'w', encoding='utf-8') as f:
+                    f.write(text)
+                saved.append(output_file)
+
+                if full_text is not None:
+                    page = os.path.splitext(os.path.basename(output_file))[0]
+                    full_text.write(f"--- {page} ---\n\n{text}\n\n")
+    except Exception as exc:
+        # El error se relanza en el hilo principal; mientras tanto se sigue
+        # vaciando la cola para que put() nunca se quede bloqueado. Si el fallo
+        # llega al cerrar el texto completo, el centinela ya se ha leído.
+        errors.append(exc)
+        while not finished:
+            finished = write_queue.get() is None
+
+@contextlib.contextmanager
+def _background_writer(full_text_path=None):
+    # Las escrituras a disco se hacen en un hilo aparte para que el OCR de la
+    # siguiente imagen no espere a que termine la anterior.
+    write_queue = queue.Queue(maxsize=64)
+    saved = collections.deque()
+    errors = []
+    writer = threading.Thread(target=_write_results, args=(write_queue, saved, errors, full_text_path))
+    writer.start()
+
+    def report_saved():
+        # Las confirmaciones se imprimen desde el hilo principal, entre lote y
+        # lote, para no intercalarse con la salida detallada del OCR.
+        while saved:
+            print(f"Resultado guardado en: {saved.popleft()}")
+
+    def write_result(output_file, text):
+        if errors:
+            raise errors[0]
+        report_saved()
+        write_queue.put((output_file, text))
+
+    try:
+        yield write_result
+    finally:
+        write_queue.put(None)
+        writer.join()
+        report_saved()
+    if errors:
+        raise errors[0]
+    if full_text_path:
+        print(f"Texto completo guardado en: {full_text_path}")
+
+def _iter_batches(read_queue, batch_size, max_wait=0.5):
+    # Si la lectura va más lenta que el OCR, no se espera indefinidamente a
+    # completar el lote: pasados max_wait segundos desde su primera imagen se
+    # procesa lo que haya.
+    batch = []
+    deadline = None
+    while True:
+        timeout = max(0.0, deadline - time.monotonic()) if batch else None
+        try:
+            item = read_queue.get(timeout=timeout)
+        except queue.Empty:
+            yield batch
+            batch = []
+            continue
+
+        if item is None:
+            break
+
+        image_path, output_file, image = item
+        print(f"Procesando: {image_path}")
+        if image is None or isinstance(image, Exception):
+            reason = f": {image}" if image is not None else "."
+            print(f"Error: No se pudo leer la imagen {image_path}{reason}")
+            continue
+
+        batch.append((image_path, output_file, image))
+        if len(batch) == 1:
+            deadline = time.monotonic() + max_wait
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+def process_folder(pipeline, tasks, batch_size=8, full_text_path=None, verbose=False, max_side=None):
+    # Lectura, OCR y escritura solapados: mientras se reconoce un lote,
+    # el siguiente ya se está decodificando y el anterior guardando.
+    read_queue = queue.Queue(maxsize=2 * batch_size)
+    reader = threading.Thread(target=_read_images, args=(tasks, read_queue),
+                              kwargs={"max_side": max_side}, daemon=True)
+    reader.start()
+
+    with _background_writer(full_text_path) as write_result:
+        for batch in _iter_batches(read_queue, batch_size):
+            texts = pipeline.process_batch([image for _, _, image in batch], verbose=verbose,
+                                           names=[image_path for image_path, _, _ in batch])
+            for (_, output_file, _), text in zip(batch, texts):
+                write_result(output_file, text)
+
+def _init_worker(options):
+    # Un hilo de cálculo por proceso: el paralelismo lo aporta el pool y, si
+    # cada proceso abriera además sus propios hilos de OpenMP/MKL/OpenCV, los
+    # núcleos quedarían sobresuscritos. Fuera del pool (una sola imagen o
+    # --procesos 1) se mantienen los valores por defecto de cada librería.
+    os.environ.setdefault("OMP_NUM_THREADS", "1")
+    os.environ.setdefault("MKL_NUM_THREADS", "1")
+    import cv2
+    cv2.setNumThreads(1)
+    _get_pipeline(warmup=True, **options)
+
+def _process_task(task, options, verbose=False, max_side=None):
+    image_path, output_file = task
+    return output_file, _recognize(_get_pipeline(**options), image_path, verbose, max_side)
+
+def process_folder_parallel(tasks, options, workers=None, full_text_path=None, verbose=False, max_side=None):
+    # "spawn" evita heredar por fork el estado interno de PaddlePaddle; cada
+    # proceso carga su propio pipeline una sola vez en el inicializador.
+    context = multiprocessing.get_context("spawn")
+    options = {**options, "cpu_threads": 1}
+    worker = functools.partial(_process_task, options=options, verbose=verbose, max_side=max_side)
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                                      initializer=_init_worker, initargs=(options,))
+    try:
+        with _background_writer(full_text_path) as write_result:
+            for output_file, text in executor.map(worker, tasks):
+                if text is not None:
+                    write_result(output_file, text)
+    except BaseException:
+        # Ante un error se descartan las páginas aún en cola; si no, el pool
+        # las procesaría todas antes de dejar salir la excepción.
+        executor.shutdown(cancel_futures=True)
+        raise
+    executor.shutdown()
+
 def main():
     parser = argparse.ArgumentParser(description="Aplicar OCR sobre imágenes o carpetas.")
     parser.add_argument("--imagen", type=str, help="Ruta de una imagen individual.")
@@ -27,6 +258,16 @@ def main():
     parser.add_argument("--salida", type=str, help="Archivo .txt para guardar el resultado (solo para imagen individual) o carpeta de salida.")
     parser.add_argument("--verbose", "-v", action="store_true", help="Mostrar detalles de confianza y posición.")
     parser.add_argument("--lang", type=str, default="en", help="Idioma para el OCR (default: en).")
+    parser.add_argument("--dispositivo", type=str, help="Dispositivo de inferencia, p. ej. cpu o gpu:0 (default: GPU si está disponible).")
+    parser.add_argument("--precision", type=str, choices=["fp32", "fp16"], help="Inferir con TensorRT a esta precisión; requiere GPU y PaddlePaddle compilado con TensorRT (default: sin TensorRT, fp32).")
+    parser.add_argument("--documento-limpio", action="store_true", help="Las imágenes ya están derechas y sin deformar: omitir la corrección de orientación y el enderezado del documento.")
+    parser.add_argument("--max-lado", type=int, metavar="PIXELES", help="Reducir antes del OCR las imágenes cuyo lado mayor supere este tamaño; con PyTurboJPEG los JPEG se reducen ya al decodificarlos.")
+    parser.add_argument("--cache", type=str, nargs="?", const=DEFAULT_CACHE_DIR, metavar="CARPETA",
+                        help=f"Reutilizar resultados de imágenes ya procesadas con la misma configuración (default: {DEFAULT_CACHE_DIR}).")
+    parser.add_argument("--lote", type=int, default=8, help="Imágenes por llamada al OCR al procesar una carpeta; no se aplica con --procesos (default: 8).")
+    parser.add_argument("--lote-rec", type=int, help="Líneas de texto que el reconocedor procesa juntas dentro de cada imagen (default: el de PaddleOCR).")
+    parser.add_argument("--texto-completo", action="store_true", help="Al procesar una carpeta, guardar además todo el texto en un único archivo texto_completo.txt.")
+    parser.add_argument("--procesos", type=int, default=1, help="Procesos en paralelo al procesar una carpeta; 0 usa todos los núcleos. Cada proceso envía las imágenes al OCR de una en una, sin --lote (default: 1).")
 
     args = parser.parse_args()
 
@@ -35,33 +276,64 @@ def main():
         print("\nError: Debe especificar --imagen o --carpeta")
         return
 
-    pipeline = OCRPipeline(lang=args.lang)
+    if args.lote < 1:
+        print("\nError: --lote debe ser al menos 1")
+        return
+
+    if args.lote_rec is not None and args.lote_rec < 1:
+        print("\nError: --lote-rec debe ser al menos 1")
+        return
+
+    if args.max_lado is not None and args.max_lado < 1:
+        print("\nError: --max-lado debe ser al menos 1")
+        return
+
+    if args.procesos < 0:
+        print("\nError: --procesos no puede ser negativo")
+        return
+
+    options = _pipeline_options(args)
 
     if args.imagen:
-        process_single_image(pipeline, args.imagen, args.salida, args.verbose)
+        process_single_image(_get_pipeline(**options), args.imagen, args.salida, args.verbose, args.max_lado)
     
     elif args.carpeta:
-        if not os.path.isdir(args.carpeta):
+        output_dir = args.salida if args.salida else "outputs"
+        # scandir ya falla si la carpeta no existe o no es un directorio, sin
+        # necesidad de comprobarlo antes con otra llamada al sistema.
+        try:
+            tasks = _list_tasks(args.carpeta, output_dir)
+        except (FileNotFoundError, NotADirectoryError):
             print(f"Error: {args.carpeta} no es un directorio válido.")
             return
         
-        output_dir = args.salida if args.salida else "outputs"
-        if not os.path.exists(output_dir):
+        if not tasks:
+            print(f"No se encontraron imágenes en {args.carpeta}")
+            return
+
+        full_text_path = os.path.join(output_dir, "texto_completo.txt") if args.texto_completo else None
+        # Una página llamada texto_completo.* tendría el mismo .txt de salida
+        # y el archivo combinado lo sobrescribiría. Se compara sin distinguir
+        # mayúsculas por los sistemas de archivos que tampoco lo hacen.
+        if full_text_path and any(output_file.casefold() == full_text_path.casefold() for _, output_file in tasks):
+            print(f"\nError: --texto-completo sobrescribiría el resultado de una imagen llamada "
+                  f"texto_completo en {args.carpeta}; renómbrela o no use --texto-completo.")
+            return
+
+        try:
             os.makedirs(output_dir)
             print(f"Creada carpeta de salida: {output_dir}")
+        except FileExistsError:
+            pass
 
-        image_extensions = ('.png', '.jpg', '.jpeg', '.bmp', '.tiff')
-        files = [f for f in os.listdir(args.carpeta) if f.lower().endswith(image_extensions)]
-        
-        if not files:
-            print(f"No se encontraron imágenes en {args.carpeta}")
-            return
+        print(f"Encontradas {len(tasks)} imágenes en {args.carpeta}")
 
-        print(f"Encontradas {len(files)} imágenes en {args.carpeta}")
-        for filename in files:
-            image_path = os.path.join(args.carpeta, filename)
-            output_file = os.path.join(output_dir, f"{os.path.splitext(filename)[0]}.txt")
-            process_single_image(pipeline, image_path, output_file, args.verbose)
+        if args.procesos == 1:
+            process_folder(_get_pipeline(**options), tasks, batch_size=args.lote,
+                           full_text_path=full_text_path, verbose=args.verbose, max_side=args.max_lado)
+        else:
+            process_folder_parallel(tasks, options, workers=args.procesos or None,
+                                    full_text_path=full_text_path, verbose=args.verbose, max_side=args.max_lado)
 
 if __name__ == "__main__":
     sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -1,19 +1,139 @@
+import atexit
+import contextlib
+import hashlib
+import json
+import os
+from importlib.metadata import PackageNotFoundError, version
+import numpy as np
 from paddleocr import PaddleOCR
 from .utils import preprocess_image
 
+# Opciones que solo afectan a cómo se ejecuta la inferencia, no a su resultado;
+# no forman parte de la huella de la caché.
+_RUNTIME_OPTIONS = frozenset({"device", "cpu_threads", "text_recognition_batch_size"})
+
+def _paddleocr_version():
+    # Una actualización de PaddleOCR puede cambiar los modelos y, con ellos,
+    # los resultados; si no hay metadatos de instalación (p. ej. una copia del
+    # código fuente) la caché se comparte entre versiones.
+    try:
+        return version("paddleocr")
+    except PackageNotFoundError:
+        return None
+
 class OCRPipeline:
-    def __init__(self, lang="en"):
-        self.ocr = PaddleOCR(lang=lang)
+    def __init__(self, lang="en", device=None, precision=None, cpu_threads=None, rec_batch_size=None,
+                 doc_preprocessing=True, cache_dir=None):
+        # Solo se pasan a PaddleOCR las opciones indicadas; el resto conserva
+        # sus valores por defecto.
+        options = {"lang": lang, "device": device, "precision": precision, "cpu_threads": cpu_threads,
+                   "text_recognition_batch_size": rec_batch_size}
+        options = {k: v for k, v in options.items() if v is not None}
+        if precision is not None:
+            # PaddleOCR solo tiene en cuenta la precisión al inferir con TensorRT;
+            # sin él los modelos se ejecutan siempre en fp32.
+            options["use_tensorrt"] = True
+        if not doc_preprocessing:
+            # Para páginas ya derechas y sin deformar (escaneos limpios, capturas)
+            # los modelos de orientación y enderezado que PaddleOCR aplica a cada
+            # imagen solo añaden tiempo.
+            options.update(use_doc_orientation_classify=False, use_doc_unwarping=False,
+                           use_textline_orientation=False)
+        self.ocr = PaddleOCR(**options)
+
+        self.cache_dir = cache_dir
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            config = {k: v for k, v in options.items() if k not in _RUNTIME_OPTIONS}
+            config["paddleocr"] = _paddleocr_version()
+            self._fingerprint = hashlib.blake2b(json.dumps(config, sort_keys=True).encode(),
+                                                digest_size=8).hexdigest()
+
+    def warmup(self):
+        # La primera inferencia paga la inicialización perezosa del predictor;
+        # una imagen en blanco la adelanta sin producir texto.
+        self.ocr.ocr(np.full((640, 640, 3), 255, dtype=np.uint8))
 
     def process_image(self, image_path, verbose=False):
-        result = self.ocr.ocr(image_path)
-        
-        if not result or len(result) == 0:
-            return ""
-        
-        ocr_result = result[0]
-        
-        if 'rec_texts' not in ocr_result:
+        return self.process_batch([image_path], verbose=verbose)[0]
+
+    def process_array(self, image, verbose=False, name=None):
+        return self.process_batch([image], verbose=verbose, names=[name])[0]
+
+    def process_batch(self, images, verbose=False, names=None):
+        # Una sola llamada a PaddleOCR para todo el lote: PaddleOCR acepta una
+        # lista de imágenes (rutas o arrays, de distinto tamaño) y devuelve un
+        # resultado por imagen.
+        images = list(images)
+        if not images:
+            return []
+
+        # En modo detallado cada bloque se identifica con su imagen; si no se
+        # indica nombre, se usa la ruta cuando la hay.
+        if names is None:
+            names = [image if isinstance(image, str) else None for image in images]
+
+        results = self._run(images) or []
+        texts = [self._extract_text(ocr_result, verbose, name)
+                 for ocr_result, name in zip(results, names)]
+        return texts + [""] * (len(images) - len(texts))
+
+    def _run(self, images):
+        if self.cache_dir is None:
+            return self.ocr.ocr(images)
+
+        # Con caché, solo llegan a PaddleOCR las imágenes que no se habían
+        # procesado antes con la misma configuración.
+        keys = [self._cache_key(image) for image in images]
+        results = [self._cache_get(key) for key in keys]
+        misses = [i for i, ocr_result in enumerate(results) if ocr_result is None]
+        if misses:
+            fresh = self.ocr.ocr([images[i] for i in misses])
+            for i, ocr_result in zip(misses, fresh):
+                results[i] = self._cache_put(keys[i], ocr_result)
+        return results
+
+    def _cache_key(self, image):
+        # Hashear la imagen cuesta milisegundos; el OCR, cientos.
+        if isinstance(image, np.ndarray):
+            digest = hashlib.blake2b(np.ascontiguousarray(image).data, digest_size=16)
+            digest.update(repr(image.shape).encode())
+        else:
+            with open(image, 'rb') as f:
+                digest = hashlib.blake2b(f.read(), digest_size=16)
+        return f"{digest.hexdigest()}_{self._fingerprint}"
+
+    def _cache_get(self, key):
+        try:
+            with open(os.path.join(self.cache_dir, f"{key}.json"), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _cache_put(self, key, ocr_result):
+        # Se guarda solo lo que usa _extract_text, en tipos nativos de JSON.
+        ocr_result = ocr_result or {}
+        entry = {
+            'rec_texts': list(ocr_result.get('rec_texts', [])),
+            'rec_scores': [float(score) for score in ocr_result.get('rec_scores', [])],
+            'rec_polys': [np.asarray(poly).tolist() for poly in ocr_result.get('rec_polys', [])],
+        }
+        # Escritura atómica: varios procesos del pool pueden compartir la caché.
+        # Si no se puede escribir (solo lectura, disco lleno), la página se
+        # queda sin cachear pero el resultado del OCR se sigue devolviendo.
+        path = os.path.join(self.cache_dir, f"{key}.json")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+        return entry
+
+    def _extract_text(self, ocr_result, verbose, name=None):
+        if not ocr_result or 'rec_texts' not in ocr_result:
             return ""
         
         texts = ocr_result['rec_texts']
@@ -22,6 +142,8 @@ class OCRPipeline:
         
         if verbose:
             print(f"\n{'='*60}")
+            if name is not None:
+                print(f"Imagen: {name}")
             print(f"Total de líneas detectadas: {len(texts)}")
             print(f"{'='*60}\n")
             
@@ -38,3 +160,22 @@ class OCRPipeline:
                     print(f"  Posición: {poly}")
         
         return "\n".join(texts)
+
+_PIPELINES = {}
+
+def get_pipeline(warmup=False, **options):
+    # Cargar los modelos de PaddleOCR tarda varios segundos: se reutiliza el
+    # pipeline ya construido con las mismas opciones dentro del proceso.
+    key = tuple(sorted(options.items()))
+    pipeline = _PIPELINES.get(key)
+    if pipeline is None:
+        pipeline = _PIPELINES[key] = OCRPipeline(**options)
+        if warmup:
+            pipeline.warmup()
+    return pipeline
+
+@atexit.register
+def _shutdown():
+    # Soltar los predictores (y la memoria de GPU que reservan) antes de que
+    # el intérprete empiece a desmontar los módulos.
+    _PIPELINES.clear()